@@ -4,12 +4,19 @@ import hmac
 import hashlib
 import base64
 import time
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, redirect, session, url_for
+import threading
+from collections import defaultdict
+from flask import Flask, request, redirect, session, url_for
 from flask_cors import CORS
 import requests
-from urllib.parse import urlencode, parse_qs
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlencode, parse_qs, unquote
 import logging
+from concurrent.futures import ThreadPoolExecutor
+import cachetools
+import orjson
+import jmespath
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your-secret-key-here')
@@ -24,120 +31,274 @@ HUBSPOT_CLIENT_ID = os.environ.get('HUBSPOT_CLIENT_ID')
 HUBSPOT_CLIENT_SECRET = os.environ.get('HUBSPOT_CLIENT_SECRET')
 HUBSPOT_REDIRECT_URI = os.environ.get('HUBSPOT_REDIRECT_URI')
 HUBSPOT_SCOPES = 'crm.objects.companies.read crm.objects.deals.read crm.objects.line_items.read'
+AUTH_URL = 'https://app.hubspot.com/oauth/authorize?' + urlencode({
+    'client_id': HUBSPOT_CLIENT_ID,
+    'redirect_uri': HUBSPOT_REDIRECT_URI,
+    'scope': HUBSPOT_SCOPES,
+    'response_type': 'code'
+})
+
+# HubSpot signs v3 requests with the app's client secret; the keyed HMAC
+# template is copied per request so the key schedule runs only once
+SIGNATURE_V3_HMAC = hmac.new((HUBSPOT_CLIENT_SECRET or '').encode('utf-8'), digestmod=hashlib.sha256)
+# Reject signed requests whose timestamp is more than five minutes off
+SIGNATURE_MAX_AGE_MS = 5 * 60 * 1000
+# Public https:// origin HubSpot calls; behind a TLS-terminating proxy the
+# URL Flask sees differs from the one HubSpot signs
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+
+# Shared HTTP session so TCP/TLS connections to HubSpot are reused across calls
+HUBSPOT_TIMEOUT = (3.05, 15)
+TOKEN_TIMEOUT = (3.05, 10)
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+SESSION = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False
+    )
+)
+SESSION.mount('https://', adapter)
+
+# Worker pool for concurrent HubSpot requests (kept below the pool size)
+EXECUTOR = ThreadPoolExecutor(max_workers=16)
+
+# Maximum number of ids accepted by HubSpot batch object and association reads
+BATCH_READ_LIMIT = 100
+BATCH_ASSOCIATIONS_LIMIT = 1000
+
+# Per-input error categories a batch association read uses for objects that
+# have no associations of the requested type
+NO_ASSOCIATIONS_ERROR_CATEGORIES = frozenset(['OBJECT_NOT_FOUND'])
 
 # In-memory storage for tokens (use database in production)
 token_storage = {}
+TOKEN_LOCK = threading.RLock()
+
+# Treat tokens as expired this many seconds early to allow for clock skew
+TOKEN_EXPIRY_SKEW = 30
+
+# Moving average of refresh call latency in seconds; widens the expiry skew
+# when HubSpot is slow so tokens are refreshed before requests hit expiry
+REFRESH_LATENCY_EMA = 0.5
+REFRESH_LATENCY_ALPHA = 0.2
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+
+# One lock per portal so concurrent requests trigger a single refresh
+REFRESH_LOCKS = defaultdict(threading.Lock)
+
+# Outcomes of a GraphQL line items query
+GRAPHQL_OK = 'ok'
+GRAPHQL_EMPTY = 'empty'
+GRAPHQL_UNAVAILABLE = 'unavailable'
+GRAPHQL_ERROR = 'error'
+
+# Deal properties and line items from a GraphQL line items response; defaults
+# are applied in Python so null or empty values are handled as before
+DEALS_EXPR = jmespath.compile(
+    'data.CRM.company.associations.deals.items[].{'
+    'properties: properties, '
+    'line_items: associations.lineItems.items'
+    '}'
+)
 
-def verify_hubspot_signature(payload, signature, secret):
-    """Verify HubSpot webhook signature"""
-    if not signature or not secret:
+# Portals where GraphQL is unavailable skip straight to REST for 5 minutes
+GRAPHQL_UNAVAILABLE_CACHE = cachetools.TTLCache(maxsize=1024, ttl=300)
+GRAPHQL_UNAVAILABLE_LOCK = threading.Lock()
+
+# Recent line items per (portal_id, company_id) so dashboard polls stay in memory
+RESULT_CACHE = cachetools.TTLCache(maxsize=4096, ttl=30)
+RESULT_LOCK = threading.Lock()
+
+# Webhook subscriptions that can change a company's line items
+LINE_ITEM_EVENT_PREFIXES = ('deal.', 'line_item.')
+
+def json_response(payload):
+    """Build a JSON response serialized with orjson"""
+    return app.response_class(orjson.dumps(payload), mimetype='application/json')
+
+def verify_hubspot_signature(method, uri, body, timestamp, signature):
+    """Verify a HubSpot v3 request signature and its timestamp"""
+    if not signature or not timestamp or not HUBSPOT_CLIENT_SECRET:
+        return False
+    
+    try:
+        age_ms = time.time() * 1000 - int(timestamp)
+    except ValueError:
+        return False
+    if abs(age_ms) > SIGNATURE_MAX_AGE_MS:
         return False
     
-    expected_signature = hmac.new(
-        secret.encode('utf-8'),
-        payload.encode('utf-8'),
-        hashlib.sha256
-    ).hexdigest()
+    mac = SIGNATURE_V3_HMAC.copy()
+    mac.update(f'{method}{unquote(uri)}'.encode('utf-8'))
+    mac.update(body)
+    mac.update(timestamp.encode('utf-8'))
+    expected_signature = base64.b64encode(mac.digest()).decode('ascii')
     
     return hmac.compare_digest(signature, expected_signature)
 
+def signed_request_uri():
+    """Rebuild the URI HubSpot signed for the current request"""
+    if not PUBLIC_BASE_URL:
+        return request.url
+    
+    uri = PUBLIC_BASE_URL + request.path
+    if request.query_string:
+        uri += '?' + request.query_string.decode('utf-8')
+    return uri
+
+def request_signature_is_valid(body):
+    """Check the current request's X-HubSpot-Signature-V3 header"""
+    return verify_hubspot_signature(
+        request.method,
+        signed_request_uri(),
+        body,
+        request.headers.get('X-HubSpot-Request-Timestamp'),
+        request.headers.get('X-HubSpot-Signature-V3')
+    )
+
+def _store_tokens(portal_id, token_data, fallback_refresh=None):
+    """Store tokens from a HubSpot token response"""
+    with TOKEN_LOCK:
+        token_storage[portal_id] = {
+            'access_token': token_data['access_token'],
+            'refresh_token': token_data.get('refresh_token', fallback_refresh),
+            'expires_at': (
+                time.monotonic() + int(token_data['expires_in'])
+                - max(TOKEN_EXPIRY_SKEW, 3 * REFRESH_LATENCY_EMA)
+            ),
+            'scope': token_data.get('scope', '')
+        }
+
 def get_hubspot_access_token(portal_id):
     """Get access token for a portal"""
     token_data = token_storage.get(portal_id)
     if not token_data:
         return None
     
-    # Check if token is expired
-    if datetime.now() > token_data['expires_at']:
+    # Token is comfortably valid, no refresh needed
+    now = time.monotonic()
+    if now + TOKEN_REFRESH_MARGIN < token_data['expires_at']:
+        return token_data['access_token']
+    
+    # Token is close to expiry: refresh in the background and keep using it
+    if now < token_data['expires_at']:
+        lock = REFRESH_LOCKS[portal_id]
+        if lock.acquire(blocking=False):
+            try:
+                EXECUTOR.submit(_refresh_in_background, portal_id, lock)
+            except RuntimeError as e:
+                # Executor is shutting down; leave the refresh to a later request
+                lock.release()
+                logger.error(f"Could not schedule token refresh for portal {portal_id}: {str(e)}")
+        return token_data['access_token']
+    
+    with REFRESH_LOCKS[portal_id]:
+        # Another request may have refreshed the token while we waited
+        token_data = token_storage.get(portal_id)
+        if time.monotonic() < token_data['expires_at']:
+            return token_data['access_token']
+        
         # Try to refresh token
         refresh_token = token_data.get('refresh_token')
         if refresh_token:
             return refresh_access_token(portal_id, refresh_token)
         return None
-    
-    return token_data['access_token']
+
+def _refresh_in_background(portal_id, lock):
+    """Refresh a portal's token, releasing the lock taken by the caller"""
+    try:
+        token_data = token_storage.get(portal_id)
+        if token_data and token_data.get('refresh_token'):
+            refresh_access_token(portal_id, token_data['refresh_token'])
+    except Exception as e:
+        logger.error(f"Background token refresh failed for portal {portal_id}: {str(e)}")
+    finally:
+        lock.release()
+
+def _record_refresh_latency(latency):
+    """Fold one refresh call duration into the moving average"""
+    global REFRESH_LATENCY_EMA
+    with TOKEN_LOCK:
+        REFRESH_LATENCY_EMA += REFRESH_LATENCY_ALPHA * (latency - REFRESH_LATENCY_EMA)
 
 def refresh_access_token(portal_id, refresh_token):
     """Refresh access token using refresh token"""
     token_url = 'https://api.hubapi.com/oauth/v1/token'
-    data = {
+    body = urlencode({
         'grant_type': 'refresh_token',
         'client_id': HUBSPOT_CLIENT_ID,
         'client_secret': HUBSPOT_CLIENT_SECRET,
         'refresh_token': refresh_token
-    }
+    }).encode('ascii')
     
-    response = requests.post(token_url, data=data)
+    started = time.monotonic()
+    response = SESSION.post(token_url, data=body, headers=FORM_HEADERS, timeout=TOKEN_TIMEOUT)
+    _record_refresh_latency(time.monotonic() - started)
     if response.status_code == 200:
-        token_data = response.json()
-        token_storage[portal_id] = {
-            'access_token': token_data['access_token'],
-            'refresh_token': token_data.get('refresh_token', refresh_token),
-            'expires_at': datetime.now() + timedelta(seconds=token_data['expires_in']),
-            'scope': token_data.get('scope', '')
-        }
+        token_data = orjson.loads(response.content)
+        _store_tokens(portal_id, token_data, fallback_refresh=refresh_token)
         return token_data['access_token']
     
     logger.error(f"Failed to refresh token for portal {portal_id}: {response.text}")
     return None
 
+def get_portal_info(access_token):
+    """Get portal information for an access token"""
+    portal_url = 'https://api.hubapi.com/oauth/v1/access-tokens/' + access_token
+    response = SESSION.get(portal_url, timeout=HUBSPOT_TIMEOUT)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
 @app.route('/oauth/start')
 def oauth_start():
     """Start OAuth flow"""
-    params = {
-        'client_id': HUBSPOT_CLIENT_ID,
-        'redirect_uri': HUBSPOT_REDIRECT_URI,
-        'scope': HUBSPOT_SCOPES,
-        'response_type': 'code'
-    }
-    
-    auth_url = f"https://app.hubspot.com/oauth/authorize?{urlencode(params)}"
-    return redirect(auth_url)
+    return redirect(AUTH_URL)
 
 @app.route('/oauth/callback')
 def oauth_callback():
     """Handle OAuth callback"""
     code = request.args.get('code')
     if not code:
-        return jsonify({'error': 'No authorization code provided'}), 400
+        return json_response({'error': 'No authorization code provided'}), 400
     
     # Exchange code for tokens
     token_url = 'https://api.hubapi.com/oauth/v1/token'
-    data = {
+    body = urlencode({
         'grant_type': 'authorization_code',
         'client_id': HUBSPOT_CLIENT_ID,
         'client_secret': HUBSPOT_CLIENT_SECRET,
         'redirect_uri': HUBSPOT_REDIRECT_URI,
         'code': code
-    }
+    }).encode('ascii')
     
-    response = requests.post(token_url, data=data)
+    response = SESSION.post(token_url, data=body, headers=FORM_HEADERS, timeout=TOKEN_TIMEOUT)
     if response.status_code != 200:
         logger.error(f"Token exchange failed: {response.text}")
-        return jsonify({'error': 'Failed to exchange code for tokens'}), 400
+        return json_response({'error': 'Failed to exchange code for tokens'}), 400
     
-    token_data = response.json()
+    token_data = orjson.loads(response.content)
     
     # Get portal information
-    portal_url = 'https://api.hubapi.com/oauth/v1/access-tokens/' + token_data['access_token']
-    portal_response = requests.get(portal_url)
-    
-    if portal_response.status_code != 200:
-        logger.error(f"Failed to get portal info: {portal_response.text}")
-        return jsonify({'error': 'Failed to get portal information'}), 400
+    try:
+        portal_data = get_portal_info(token_data['access_token'])
+    except requests.RequestException as e:
+        logger.error(f"Failed to get portal info: {str(e)}")
+        return json_response({'error': 'Failed to get portal information'}), 400
     
-    portal_data = portal_response.json()
     portal_id = portal_data['hub_id']
     
     # Store tokens
-    token_storage[portal_id] = {
-        'access_token': token_data['access_token'],
-        'refresh_token': token_data.get('refresh_token'),
-        'expires_at': datetime.now() + timedelta(seconds=token_data['expires_in']),
-        'scope': token_data.get('scope', '')
-    }
+    _store_tokens(portal_id, token_data)
     
-    return jsonify({
+    return json_response({
         'message': 'OAuth successful',
         'portal_id': portal_id,
         'access_token': token_data['access_token']
@@ -149,40 +310,99 @@ def get_company_line_items(company_id):
     # Get portal ID from request headers or session
     portal_id = request.headers.get('X-HubSpot-Portal-Id')
     if not portal_id:
-        return jsonify({'error': 'Portal ID not provided'}), 400
+        return json_response({'error': 'Portal ID not provided'}), 400
     
-    # Verify HubSpot signature
+    # Verify HubSpot signature; UI requests without one never touch the body
     signature = request.headers.get('X-HubSpot-Signature-V3')
-    if signature:
-        # In production, you should get the webhook secret from HubSpot
-        webhook_secret = os.environ.get('HUBSPOT_WEBHOOK_SECRET', '')
-        if not verify_hubspot_signature(request.get_data(as_text=True), signature, webhook_secret):
-            return jsonify({'error': 'Invalid signature'}), 401
+    if signature is not None:
+        if not HUBSPOT_CLIENT_SECRET:
+            return json_response({'error': 'Invalid signature'}), 401
+        if not request_signature_is_valid(request.get_data(cache=False)):
+            return json_response({'error': 'Invalid signature'}), 401
     
     # Get access token
     access_token = get_hubspot_access_token(portal_id)
     if not access_token:
-        return jsonify({'error': 'No valid access token found'}), 401
+        return json_response({'error': 'No valid access token found'}), 401
+    
+    # Serve recent results from memory unless a fresh fetch is requested
+    cache_key = (portal_id, company_id)
+    if request.args.get('fresh') != '1':
+        with RESULT_LOCK:
+            line_items = RESULT_CACHE.get(cache_key)
+        if line_items is not None:
+            return json_response({
+                'company_id': company_id,
+                'line_items': line_items
+            })
     
     try:
-        # Get company deals using GraphQL
-        line_items = get_company_line_items_graphql(access_token, company_id)
+        with GRAPHQL_UNAVAILABLE_LOCK:
+            graphql_unavailable = portal_id in GRAPHQL_UNAVAILABLE_CACHE
+        
+        if graphql_unavailable:
+            status, line_items = GRAPHQL_UNAVAILABLE, None
+        else:
+            # Get company deals using GraphQL
+            status, line_items = get_company_line_items_graphql(access_token, company_id)
+            if status == GRAPHQL_UNAVAILABLE:
+                with GRAPHQL_UNAVAILABLE_LOCK:
+                    GRAPHQL_UNAVAILABLE_CACHE[portal_id] = True
         
-        if line_items is None:
+        complete = True
+        if status == GRAPHQL_EMPTY:
+            line_items = []
+        elif status != GRAPHQL_OK:
             # Fallback to REST API
-            line_items = get_company_line_items_rest(access_token, company_id)
+            complete, line_items = get_company_line_items_rest(access_token, company_id)
         
-        return jsonify({
+        # Partial results from failed HubSpot calls must not outlive this request
+        if complete:
+            with RESULT_LOCK:
+                RESULT_CACHE[cache_key] = line_items
+        
+        return json_response({
             'company_id': company_id,
             'line_items': line_items
         })
     
     except Exception as e:
         logger.error(f"Error fetching line items: {str(e)}")
-        return jsonify({'error': 'Failed to fetch line items'}), 500
+        return json_response({'error': 'Failed to fetch line items'}), 500
+
+@app.route('/webhooks', methods=['POST'])
+def handle_webhook():
+    """Drop cached line items when HubSpot reports deal or line item changes"""
+    if not request_signature_is_valid(request.get_data()):
+        return json_response({'error': 'Invalid signature'}), 401
+    
+    try:
+        events = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return json_response({'error': 'Invalid payload'}), 400
+    if not isinstance(events, list):
+        return json_response({'error': 'Invalid payload'}), 400
+    
+    # Events only identify the deal or line item, so clear the whole portal
+    portal_ids = {
+        str(event.get('portalId'))
+        for event in events
+        if isinstance(event, dict)
+        and (event.get('subscriptionType') or '').startswith(LINE_ITEM_EVENT_PREFIXES)
+    }
+    if portal_ids:
+        with RESULT_LOCK:
+            for key in [key for key in RESULT_CACHE if key[0] in portal_ids]:
+                RESULT_CACHE.pop(key, None)
+    
+    return json_response({'status': 'ok'})
 
 def get_company_line_items_graphql(access_token, company_id):
-    """Get line items using GraphQL API"""
+    """Get line items using GraphQL API
+    
+    Returns a (status, line_items) tuple where status is one of the
+    GRAPHQL_* constants; line_items is None unless the query succeeded.
+    """
     query = """
     query GetCompanyLineItems($companyId: ID!) {
       CRM {
@@ -222,32 +442,39 @@ def get_company_line_items_graphql(access_token, company_id):
         'Content-Type': 'application/json'
     }
     
-    response = requests.post(
-        'https://api.hubapi.com/crm/v3/objects/companies/graphql',
-        headers=headers,
-        json={'query': query, 'variables': variables}
-    )
+    try:
+        response = SESSION.post(
+            'https://api.hubapi.com/crm/v3/objects/companies/graphql',
+            headers=headers,
+            data=orjson.dumps({'query': query, 'variables': variables}),
+            timeout=HUBSPOT_TIMEOUT
+        )
+    except requests.RequestException as e:
+        logger.warning(f"GraphQL request failed: {str(e)}")
+        return GRAPHQL_ERROR, None
+    
+    if response.status_code in (403, 404):
+        # Endpoint or scope not available for this portal
+        logger.warning(f"GraphQL unavailable: {response.text}")
+        return GRAPHQL_UNAVAILABLE, None
     
     if response.status_code != 200:
         logger.warning(f"GraphQL request failed: {response.text}")
-        return None
+        return GRAPHQL_ERROR, None
     
-    data = response.json()
+    data = orjson.loads(response.content)
     if 'errors' in data:
         logger.warning(f"GraphQL errors: {data['errors']}")
-        return None
+        return GRAPHQL_ERROR, None
     
     # Process GraphQL response
+    blocks = DEALS_EXPR.search(data) or []
     line_items = []
-    company_data = data.get('data', {}).get('CRM', {}).get('company', {})
-    deals = company_data.get('associations', {}).get('deals', {}).get('items', [])
-    
-    for deal in deals:
-        deal_name = deal.get('properties', {}).get('dealname', 'Unknown Deal')
-        line_items_data = deal.get('associations', {}).get('lineItems', {}).get('items', [])
+    for block in blocks:
+        deal_name = (block['properties'] or {}).get('dealname', 'Unknown Deal')
         
-        for line_item in line_items_data:
-            props = line_item.get('properties', {})
+        for line_item in block['line_items'] or []:
+            props = line_item.get('properties') or {}
             line_items.append({
                 'deal_name': deal_name,
                 'line_item_name': props.get('name', 'Unknown Item'),
@@ -256,10 +483,80 @@ def get_company_line_items_graphql(access_token, company_id):
                 'amount': props.get('amount', 0)
             })
     
-    return line_items
+    if not line_items:
+        return GRAPHQL_EMPTY, line_items
+    return GRAPHQL_OK, line_items
+
+def batch_read_objects(object_type, object_ids, properties, headers):
+    """Read HubSpot objects in batches of 100 and index them by id
+    
+    Returns an (objects, complete) tuple; complete is False when any
+    batch failed or HubSpot could not read some of the ids.
+    """
+    url = f'https://api.hubapi.com/crm/v3/objects/{object_type}/batch/read'
+    chunks = [object_ids[i:i + BATCH_READ_LIMIT] for i in range(0, len(object_ids), BATCH_READ_LIMIT)]
+    
+    objects = {}
+    complete = True
+    for chunk in chunks:
+        response = SESSION.post(
+            url,
+            headers=headers,
+            data=orjson.dumps({'properties': properties, 'inputs': [{'id': object_id} for object_id in chunk]}),
+            timeout=HUBSPOT_TIMEOUT
+        )
+        # 207 means some ids could not be read; the rest are still returned
+        if response.status_code != 200:
+            complete = False
+        if response.status_code not in (200, 207):
+            logger.warning(f"Batch read of {object_type} failed: {response.text}")
+            continue
+        for result in orjson.loads(response.content).get('results', []):
+            objects[result['id']] = result
+    return objects, complete
+
+def batch_read_associations(from_type, to_type, object_ids, headers):
+    """Read associations for many objects at once, keyed by source id
+    
+    Returns an (associations, complete) tuple like batch_read_objects.
+    """
+    url = f'https://api.hubapi.com/crm/v4/associations/{from_type}/{to_type}/batch/read'
+    chunks = [
+        object_ids[i:i + BATCH_ASSOCIATIONS_LIMIT]
+        for i in range(0, len(object_ids), BATCH_ASSOCIATIONS_LIMIT)
+    ]
+    
+    associations = {}
+    complete = True
+    for chunk in chunks:
+        response = SESSION.post(
+            url,
+            headers=headers,
+            data=orjson.dumps({'inputs': [{'id': object_id} for object_id in chunk]}),
+            timeout=HUBSPOT_TIMEOUT
+        )
+        if response.status_code not in (200, 207):
+            logger.warning(f"Batch association read {from_type}->{to_type} failed: {response.text}")
+            complete = False
+            continue
+        
+        data = orjson.loads(response.content)
+        # A 207 is common when some objects simply have no associations;
+        # only other per-input errors mean the result is incomplete
+        for error in data.get('errors', []):
+            if error.get('category') not in NO_ASSOCIATIONS_ERROR_CATEGORIES:
+                logger.warning(f"Batch association read {from_type}->{to_type} error: {error}")
+                complete = False
+        for result in data.get('results', []):
+            associations[result['from']['id']] = [str(to['toObjectId']) for to in result.get('to', [])]
+    return associations, complete
 
 def get_company_line_items_rest(access_token, company_id):
-    """Get line items using REST API (fallback)"""
+    """Get line items using REST API (fallback)
+    
+    Returns a (complete, line_items) tuple; complete is False when any
+    HubSpot call failed and line_items may be missing entries.
+    """
     headers = {
         'Authorization': f'Bearer {access_token}',
         'Content-Type': 'application/json'
@@ -267,51 +564,49 @@ def get_company_line_items_rest(access_token, company_id):
     
     # Get company deals
     deals_url = f'https://api.hubapi.com/crm/v3/objects/companies/{company_id}/associations/deals'
-    deals_response = requests.get(deals_url, headers=headers)
+    deals_response = SESSION.get(deals_url, headers=headers, timeout=HUBSPOT_TIMEOUT)
     
     if deals_response.status_code != 200:
         logger.error(f"Failed to get deals: {deals_response.text}")
-        return []
+        return False, []
     
-    deals_data = deals_response.json()
-    line_items = []
+    deals_data = orjson.loads(deals_response.content)
+    deal_ids = [a['id'] for a in deals_data.get('results', [])]
     
-    # Get line items for each deal
-    for deal_association in deals_data.get('results', []):
-        deal_id = deal_association['id']
-        
-        # Get deal details
-        deal_url = f'https://api.hubapi.com/crm/v3/objects/deals/{deal_id}'
-        deal_response = requests.get(deal_url, headers=headers)
-        
-        if deal_response.status_code != 200:
+    # Read deal names and line item associations concurrently
+    deals_future = EXECUTOR.submit(batch_read_objects, 'deals', deal_ids, ['dealname'], headers)
+    associations, associations_complete = batch_read_associations('deals', 'line_items', deal_ids, headers)
+    deals, deals_complete = deals_future.result()
+    
+    deal_line_item_ids = {
+        deal_id: associations[deal_id]
+        for deal_id in deal_ids
+        if deal_id in associations
+    }
+    
+    # Batch read every line item across all deals
+    line_item_ids = list(dict.fromkeys(
+        line_item_id
+        for ids in deal_line_item_ids.values()
+        for line_item_id in ids
+    ))
+    line_item_details, line_items_complete = batch_read_objects(
+        'line_items', line_item_ids, ['name', 'quantity', 'price', 'amount'], headers
+    )
+    
+    line_items = []
+    for deal_id, ids in deal_line_item_ids.items():
+        deal_data = deals.get(deal_id)
+        if deal_data is None:
             continue
         
-        deal_data = deal_response.json()
         deal_name = deal_data.get('properties', {}).get('dealname', 'Unknown Deal')
-        
-        # Get line items for this deal
-        line_items_url = f'https://api.hubapi.com/crm/v3/objects/deals/{deal_id}/associations/line_items'
-        line_items_response = requests.get(line_items_url, headers=headers)
-        
-        if line_items_response.status_code != 200:
-            continue
-        
-        line_items_data = line_items_response.json()
-        
-        # Get details for each line item
-        for line_item_association in line_items_data.get('results', []):
-            line_item_id = line_item_association['id']
-            
-            line_item_url = f'https://api.hubapi.com/crm/v3/objects/line_items/{line_item_id}'
-            line_item_response = requests.get(line_item_url, headers=headers)
-            
-            if line_item_response.status_code != 200:
+        for line_item_id in ids:
+            line_item_data = line_item_details.get(line_item_id)
+            if line_item_data is None:
                 continue
             
-            line_item_data = line_item_response.json()
             props = line_item_data.get('properties', {})
-            
             line_items.append({
                 'deal_name': deal_name,
                 'line_item_name': props.get('name', 'Unknown Item'),
@@ -320,12 +615,13 @@ def get_company_line_items_rest(access_token, company_id):
                 'amount': props.get('amount', 0)
             })
     
-    return line_items
+    complete = associations_complete and deals_complete and line_items_complete
+    return complete, line_items
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy'})
+    return json_response({'status': 'healthy'})
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
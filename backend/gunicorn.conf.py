@@ -0,0 +1,16 @@
+import os
+
+bind = '0.0.0.0:5000'
+
+# Tokens and caches live in process memory, so a single worker is the safe
+# default. Once tokens are kept in shared storage, 2 * CPUs + 1 is a good
+# starting point.
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+# Threaded workers pair with the pooled HTTP session and thread pool in app.py
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Keep connections from the HubSpot UI open between requests
+keepalive = 10
+timeout = 30